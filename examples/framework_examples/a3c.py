@@ -5,6 +5,7 @@ from machin.utils.logging import default_logger as logger
 from torch.multiprocessing import spawn
 from torch.distributions import Categorical
 import gym
+import numpy as np
 import torch as t
 import torch.nn as nn
 
@@ -84,7 +85,8 @@ def main(rank):
         terminal = False
         step = 0
 
-        state = t.tensor(env.reset(), dtype=t.float32).view(1, observe_dim)
+        state = t.from_numpy(np.asarray(env.reset(), dtype=np.float32)) \
+            .view(1, observe_dim)
 
         # manually pull the newest parameters
         a3c.manual_sync()
@@ -96,7 +98,8 @@ def main(rank):
                 # agent model inference
                 action = a3c.act({"state": old_state})[0]
                 state, reward, terminal, _ = env.step(action.item())
-                state = t.tensor(state, dtype=t.float32).view(1, observe_dim)
+                state = t.from_numpy(np.asarray(state, dtype=np.float32)) \
+                    .view(1, observe_dim)
                 total_reward += reward
 
                 tmp_observations.append({
@@ -1,6 +1,7 @@
 from machin.frame.algorithms import PPO
 from machin.utils.logging import default_logger as logger
 from torch.distributions import Categorical
+import numpy as np
 import torch as t
 import torch.nn as nn
 import gym
@@ -68,7 +69,8 @@ if __name__ == "__main__":
         total_reward = 0
         terminal = False
         step = 0
-        state = t.tensor(env.reset(), dtype=t.float32).view(1, observe_dim)
+        state = t.from_numpy(np.asarray(env.reset(), dtype=np.float32)) \
+            .view(1, observe_dim)
 
         tmp_observations = []
         while not terminal and step <= max_steps:
@@ -78,7 +80,8 @@ if __name__ == "__main__":
                 # agent model inference
                 action = ppo.act({"state": old_state})[0]
                 state, reward, terminal, _ = env.step(action.item())
-                state = t.tensor(state, dtype=t.float32).view(1, observe_dim)
+                state = t.from_numpy(np.asarray(state, dtype=np.float32)) \
+                    .view(1, observe_dim)
                 total_reward += reward
 
                 tmp_observations.append({
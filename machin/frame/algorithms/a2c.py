@@ -112,7 +112,9 @@ class A2C(TorchFramework):
                                   if action is not None
                                   else dist.sample())
                         action_entropy = dist.entropy()
-                        action = action.clamp(-2.0, 2.0)
+                        # evaluate the log likelihood of the sampled action,
+                        # do not clamp it here, only clamp the action sent
+                        # to your environment: action.clamp(-2.0, 2.0)
                         action_log_prob = dist.log_prob(action)
                         return action, action_log_prob, action_entropy
 
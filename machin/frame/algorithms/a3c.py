@@ -24,6 +24,7 @@ class A3C(A2C):
                  replay_device: Union[str, t.device] = "cpu",
                  replay_buffer: Buffer = None,
                  visualize: bool = False,
+                 pull_interval: int = 1,
                  **__):
         """
         See Also:
@@ -47,6 +48,10 @@ class A3C(A2C):
             including samplers and trainers, can access the updated
             parameters.
 
+            As in the original A3C paper, a worker may keep its local
+            parameters fixed during a rollout of ``pull_interval`` steps,
+            instead of pulling the newest parameters on every step.
+
             The ``grad_servers`` argument is a pair of accessors to
             two :class:`.PushPullGradServerImpl` class.
 
@@ -73,6 +78,11 @@ class A3C(A2C):
                 compatible with ``replay_buffer``.
             replay_buffer: Custom replay buffer.
             visualize: Whether visualize the network flow in the first pass.
+            pull_interval: Number of ``act`` / ``_eval_act`` (for actor)
+                and ``_criticize`` (for critic) calls between two
+                parameter pulls from the grad server. Parameters pulled
+                by :meth:`manual_sync` and :meth:`update` are also used
+                for this many calls.
         """
         # Adam is just a placeholder here, the actual optimizer is
         # set in parameter servers
@@ -93,6 +103,10 @@ class A3C(A2C):
         self.actor_grad_server, self.critic_grad_server = \
             grad_server[0], grad_server[1]
         self.is_syncing = True
+        self.pull_interval = pull_interval
+        # None means the next call must pull
+        self._actor_step_since_pull = None
+        self._critic_step_since_pull = None
 
     def set_sync(self, is_syncing):
         self.is_syncing = is_syncing
@@ -100,11 +114,36 @@ class A3C(A2C):
     def manual_sync(self):
         self.actor_grad_server.pull(self.actor)
         self.critic_grad_server.pull(self.critic)
+        self._actor_step_since_pull = 0
+        self._critic_step_since_pull = 0
+
+    def start_rollout(self):
+        """
+        Force the next ``act`` / ``_eval_act`` and ``_criticize`` calls
+        to pull the newest parameters, call this at the start of a rollout
+        if it is not aligned with ``pull_interval``.
+        """
+        self._actor_step_since_pull = None
+        self._critic_step_since_pull = None
+
+    def _sync_actor(self):
+        if (self._actor_step_since_pull is None or
+                self._actor_step_since_pull >= self.pull_interval):
+            self.actor_grad_server.pull(self.actor)
+            self._actor_step_since_pull = 0
+        self._actor_step_since_pull += 1
+
+    def _sync_critic(self):
+        if (self._critic_step_since_pull is None or
+                self._critic_step_since_pull >= self.pull_interval):
+            self.critic_grad_server.pull(self.critic)
+            self._critic_step_since_pull = 0
+        self._critic_step_since_pull += 1
 
     def act(self, state: Dict[str, Any], **__):
         # DOC INHERITED
         if self.is_syncing:
-            self.actor_grad_server.pull(self.actor)
+            self._sync_actor()
         return super(A3C, self).act(state)
 
     def _eval_act(self,
@@ -113,13 +152,13 @@ class A3C(A2C):
                   **__):
         # DOC INHERITED
         if self.is_syncing:
-            self.actor_grad_server.pull(self.actor)
+            self._sync_actor()
         return super(A3C, self)._eval_act(state, action)
 
     def _criticize(self, state: Dict[str, Any], *_, **__):
         # DOC INHERITED
         if self.is_syncing:
-            self.critic_grad_server.pull(self.critic)
+            self._sync_critic()
         return super(A3C, self)._criticize(state)
 
     def update(self,
@@ -130,8 +169,17 @@ class A3C(A2C):
         # DOC INHERITED
         org_sync = self.is_syncing
         self.is_syncing = False
-        super(A3C, self).update(update_value, update_policy,
-                                concatenate_samples)
-        self.is_syncing = org_sync
-        self.actor_grad_server.push(self.actor)
-        self.critic_grad_server.push(self.critic)
+        try:
+            super(A3C, self).update(update_value, update_policy,
+                                    concatenate_samples)
+        finally:
+            self.is_syncing = org_sync
+        # send both gradients first, then pull while they are in flight
+        actor_future = self.actor_grad_server.push_async(self.actor)
+        critic_future = self.critic_grad_server.push_async(self.critic)
+        self.actor_grad_server.pull(self.actor)
+        self.critic_grad_server.pull(self.critic)
+        actor_future.wait()
+        critic_future.wait()
+        self._actor_step_since_pull = 0
+        self._critic_step_since_pull = 0
@@ -1,11 +1,20 @@
 from typing import Union, Dict, List, Tuple, Any, Callable
-from ..transition import Transition, Scalar, TransitionStorageSmart, TransitionStorageBasic
+from functools import partial
+from ..transition import (
+    Transition,
+    Scalar,
+    TransitionStorageSmart,
+    TransitionStorageBasic,
+    TransitionStorageColumnar
+)
 import torch as t
+import numpy as np
 import random
 
 
 class Buffer(object):
-    def __init__(self, buffer_size, buffer_device="cpu", *_, **__):
+    def __init__(self, buffer_size, buffer_device="cpu", *_,
+                 columnar=False, pin_memory=False, **__):
         """
         Create a buffer instance.
 
@@ -21,13 +30,48 @@ class Buffer(object):
         any other custom keys specified in ``**kwargs`` will not be
         concatenated.
 
+        Note:
+            If ``columnar`` is ``True``, transitions are stored in
+            a :class:`.TransitionStorageColumnar`, and the builtin
+            ``"random", "random_unique", "all"`` sample methods will
+            select rows from preallocated columns in one operation, instead
+            of concatenating sampled transitions one by one. All transitions
+            must then have the same attributes, tensor shapes and dtypes.
+
+        Note:
+            If ``pin_memory`` is also ``True``, columns are allocated in page
+            locked memory, rows sampled by ``"random"`` and
+            ``"random_unique"`` will be copied to cuda devices
+            asynchronously. Requires ``buffer_device`` to be "cpu" and
+            CUDA to be available. Only this class supports ``columnar``
+            and ``pin_memory``, buffer subclasses such as
+            :class:`.PrioritizedBuffer` and :class:`.DistributedBuffer`
+            always store transitions in lists.
+
         Args:
             buffer_size: Maximum buffer size.
             buffer_device: Device where buffer is stored.
+            columnar: Whether to store transitions in columns.
+            pin_memory: Whether to store columns in page locked memory.
+
+        Raises:
+            ``ValueError`` if ``pin_memory`` is ``True``, and ``columnar``
+            is ``False`` or ``buffer_device`` is not "cpu".
         """
+        if pin_memory and not columnar:
+            raise ValueError("Only columnar buffers could be pinned, "
+                             "set columnar=True to use pin_memory")
+        if pin_memory and t.device(buffer_device).type != "cpu":
+            raise ValueError("Only buffers stored on cpu could be pinned, "
+                             "buffer_device is {}".format(buffer_device))
         self.buffer_size = buffer_size
         self.buffer_device = buffer_device
-        self.buffer = TransitionStorageSmart(buffer_size)
+        self.columnar = columnar
+        self.pin_memory = pin_memory
+        self.buffer = (TransitionStorageColumnar(buffer_size, buffer_device,
+                                                 pin_memory)
+                       if columnar
+                       else TransitionStorageSmart(buffer_size))
         self.index = 0
 
     def append(self, transition: Union[Transition, Dict],
@@ -49,7 +93,9 @@ class Buffer(object):
         if isinstance(transition, dict):
             transition = Transition(**transition)
         elif isinstance(transition, Transition):
-            pass
+            # attributes may have been reassigned after initialization,
+            # do not keep their autograd graph alive in the buffer.
+            transition._detach()
         else:  # pragma: no cover
             raise RuntimeError("Transition object must be a dict or an instance"
                                " of the Transition class")
@@ -57,9 +103,15 @@ class Buffer(object):
             missing_keys = set(required_attrs) - set(transition.keys())
             raise ValueError("Transition object missing attributes: {}"
                              .format(missing_keys))
+        if self.columnar:
+            # columnar storage will copy and check the transition by itself
+            return self.buffer.store(transition)
+
         transition.to(self.buffer_device)
 
-        if self.size() != 0 and self.buffer[0].keys() != transition.keys():
+        # not self.size(), which may be overridden to acquire locks
+        if len(self.buffer) != 0 and \
+                self.buffer[0].keys() != transition.keys():
             raise ValueError("Transition object has different attributes!")
 
         return self.buffer.store(transition)
@@ -103,9 +155,9 @@ class Buffer(object):
         Note:
             Sampled size could be any value from 0 to ``batch_size``.
         """
-        indexes = [random.randint(0, len(buffer) - 1)
-                   for _ in range(batch_size)]
-        batch = [buffer[i] for i in indexes]
+        if len(buffer) == 0:
+            return 0, []
+        batch = random.choices(buffer, k=batch_size)
         return batch_size, batch
 
     @staticmethod
@@ -147,6 +199,11 @@ class Buffer(object):
             attributes can be concatenated, such as ``int``, ``float``,
             ``bool``.
 
+            If the buffer is ``columnar`` and ``sample_method`` is ``"all"``,
+            sampled tensors on the buffer device are views of the storage
+            instead of copies, you must not modify them, and they will be
+            overwritten by following appends.
+
         Args:
             batch_size: A hint size of the result sample. actual sample size
                         depends on your sample method.
@@ -154,6 +211,9 @@ class Buffer(object):
                            ``"random", "random_unique", "all"``,
                            or a function:
                            ``func(list, batch_size)->(list, result_size)``
+                           if ``columnar`` is ``True``, the function
+                           receives a :class:`.TransitionStorageColumnar`
+                           sequence instead of a list.
             concatenate: Whether concatenate state, action and next_state
                          in dimension 0.
                          If ``True``, for each value in dictionaries of major
@@ -188,21 +248,146 @@ class Buffer(object):
                - For custom attributes, if they are not in
                  ``additional_concat_attrs``, then lists, otherwise tensors.
         """
+        with t.no_grad():
+            return self._sample_batch(batch_size, concatenate, device,
+                                      sample_method, sample_attrs,
+                                      additional_concat_attrs)
+
+    def _sample_batch(self,
+                      batch_size: int,
+                      concatenate: bool,
+                      device: Union[str, t.device],
+                      sample_method: Union[Callable, str],
+                      sample_attrs: List[str],
+                      additional_concat_attrs: List[str]):
+        if device is None:
+            device = self.buffer_device
+
         if isinstance(sample_method, str):
             if not hasattr(self, "sample_method_" + sample_method):
                 raise RuntimeError("Cannot find specified sample method: {}"
                                    .format(sample_method))
+            if self.columnar and sample_method in ("random",
+                                                   "random_unique",
+                                                   "all"):
+                batch_size, index = self._sample_index(sample_method,
+                                                       batch_size)
+                return \
+                    batch_size, \
+                    self.post_process_columns(index, batch_size, device,
+                                              concatenate, sample_attrs,
+                                              additional_concat_attrs)
             sample_method = getattr(self, "sample_method_" + sample_method)
         batch_size, batch = sample_method(self.buffer, batch_size)
 
-        if device is None:
-            device = self.buffer_device
-
         return \
             batch_size, \
             self.post_process_batch(batch, device, concatenate,
                                     sample_attrs, additional_concat_attrs)
 
+    def _sample_index(self, sample_method: str, batch_size: int):
+        """
+        Columnar version of builtin sample methods, returns sampled
+        batch size and row indexes, indexes will be ``None`` if all rows
+        are sampled.
+        """
+        size = self.size()
+        if sample_method == "all":
+            return size, None
+        elif size == 0:
+            return 0, t.zeros([0], dtype=t.long)
+        elif sample_method == "random":
+            return batch_size, t.randint(size, [batch_size])
+        else:
+            # random.sample is O(batch_size), while randperm is O(size)
+            batch_size = min(size, batch_size)
+            return batch_size, t.tensor(random.sample(range(size),
+                                                      batch_size),
+                                        dtype=t.long)
+
+    def post_process_columns(self,
+                             index: Union[t.Tensor, None],
+                             batch_size: int,
+                             device: Union[str, t.device],
+                             concatenate: bool,
+                             sample_attrs: List[str],
+                             additional_concat_attrs: List[str]):
+        """
+        Post-process (concatenate) sampled rows of the columnar storage.
+        Same as :meth:`post_process_batch`.
+        """
+        result = []
+        used_keys = []
+
+        if batch_size == 0:
+            return None
+        if sample_attrs is None:
+            sample_attrs = self.buffer.keys()
+        if additional_concat_attrs is None:
+            additional_concat_attrs = []
+
+        storage = self.buffer
+        # views of columns (index is None) may be overwritten by following
+        # appends, only freshly gathered rows are copied asynchronously.
+        non_blocking = storage.pin_memory and index is not None
+        major_attr = set(storage.major_attr)
+        sub_attr = set(storage.sub_attr)
+        custom_attr = set(storage.custom_attr)
+        for attr in sample_attrs:
+            if attr in major_attr:
+                tmp_dict = {}
+                for sub_k in storage.columns[attr].keys():
+                    tmp_dict[sub_k] = self._make_tensor_from_column(
+                        storage.gather(index, attr, sub_k),
+                        device, concatenate, non_blocking
+                    )
+                result.append(tmp_dict)
+                used_keys.append(attr)
+            elif attr in sub_attr:
+                data = storage.gather(index, attr)
+                if not concatenate and attr in storage.sub_scalar_attr:
+                    result.append(data.view(-1).tolist())
+                else:
+                    result.append(self._make_tensor_from_column(
+                        data, device, concatenate, non_blocking
+                    ))
+                used_keys.append(attr)
+            elif attr == "*":
+                # select custom keys
+                tmp_dict = {}
+                for remain_k in storage.keys():
+                    if (remain_k not in major_attr and
+                            remain_k not in sub_attr and
+                            remain_k not in used_keys):
+                        tmp_dict[remain_k] = self.make_tensor_from_batch(
+                            storage.gather(index, remain_k),
+                            device,
+                            concatenate and remain_k in additional_concat_attrs
+                        )
+                result.append(tmp_dict)
+            elif attr in custom_attr:
+                result.append(self.make_tensor_from_batch(
+                    storage.gather(index, attr),
+                    device,
+                    concatenate and attr in additional_concat_attrs
+                ))
+                used_keys.append(attr)
+        return tuple(result)
+
+    @staticmethod
+    def _make_tensor_from_column(column: t.Tensor,
+                                 device: Union[str, t.device],
+                                 concatenate: bool,
+                                 non_blocking: bool = False):
+        """
+        Move selected rows of a column to device, split them into a list
+        of tensors of batch size 1 if not concatenating.
+        """
+        column = column.to(device, non_blocking=non_blocking)
+        if concatenate:
+            return column
+        return list(column.split(1, dim=0))
+
     @classmethod
     def post_process_batch(cls,
                            batch: List[Transition],
@@ -230,8 +415,12 @@ class Buffer(object):
             if attr in major_attr:
                 tmp_dict = {}
                 for sub_k in batch[0][attr].keys():
+                    # when concatenating, tensors are concatenated on the
+                    # buffer device first, then moved with a single copy
                     tmp_dict[sub_k] = cls.make_tensor_from_batch(
-                        [item[attr][sub_k].to(device) for item in batch],
+                        [item[attr][sub_k] for item in batch]
+                        if concatenate
+                        else [item[attr][sub_k].to(device) for item in batch],
                         device, concatenate
                     )
                 result.append(tmp_dict)
@@ -286,12 +475,21 @@ class Buffer(object):
         if concatenate and len(batch) != 0:
             item = batch[0]
             batch_size = len(batch)
+            # copies to cuda are ordered on the current stream, it is safe
+            # to not block the host, but not the other way round
+            non_blocking = t.device(device).type == "cuda"
             if t.is_tensor(item):
-                batch = [it.to(device) for it in batch]
-                return t.cat(batch, dim=0).to(device)
+                return t.cat(batch, dim=0).to(device,
+                                              non_blocking=non_blocking)
             else:
                 try:
-                    return t.tensor(batch, device=device).view(batch_size, -1)
+                    # np.asarray converts python scalars in C, and infers
+                    # the same bool / int64 / float dtypes as t.tensor
+                    batch = t.from_numpy(np.asarray(batch))
+                    if batch.is_floating_point():
+                        batch = batch.to(t.get_default_dtype())
+                    batch = batch.view(batch_size, -1)
+                    return batch.to(device, non_blocking=non_blocking)
                 except Exception:
                     raise ValueError("Batch not concatenable: {}"
                                      .format(batch))
@@ -300,4 +498,6 @@ class Buffer(object):
 
     def __reduce__(self):
         # for pickling
-        return self.__class__, (self.buffer_size, self.buffer_device)
+        return partial(self.__class__, columnar=self.columnar,
+                       pin_memory=self.pin_memory), \
+            (self.buffer_size, self.buffer_device)
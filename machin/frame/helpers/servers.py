@@ -1,4 +1,5 @@
 from typing import Callable, Any, List
+import torch as t
 from machin.parallel.distributed import (
     get_world, get_cur_name
 )
@@ -11,7 +12,8 @@ from torch.optim import Adam
 
 def grad_server_helper(model_creators: List[Callable],
                        optimizer: Any = Adam,
-                       learning_rate: float = 1e-3):
+                       learning_rate: float = 1e-3,
+                       compress_dtype: t.dtype = None):
     """
     Helper function for creating a tuple of grad servers,
     used by A3C, IMPALE, etc. This function requires all processes
@@ -25,6 +27,8 @@ def grad_server_helper(model_creators: List[Callable],
             each one corresponds to one gradient reduction server.
         optimizer: Optimizer type, default is Adam.
         learning_rate: Learning rate of the optimizer.
+        compress_dtype: Dtype used to transmit gradients, eg:
+            ``torch.bfloat16``, default is no compression.
 
     Returns:
         A tuple of accessors to gradient servers, the tuple has the
@@ -46,7 +50,8 @@ def grad_server_helper(model_creators: List[Callable],
     servers = [
         PushPullGradServerImpl("grad_server_" + str(i),
                                server_group,
-                               primary_reducer=primary_reducer)
+                               primary_reducer=primary_reducer,
+                               compress_dtype=compress_dtype)
         for i in range(len(model_creators))
     ]
     if get_cur_name() == primary_reducer:
@@ -1,4 +1,5 @@
 from typing import Union, Dict, Iterable, Any, NewType
+from collections.abc import Sequence
 from itertools import chain
 from copy import deepcopy
 import torch as t
@@ -131,14 +132,21 @@ class TransitionBase(object):
         Returns:
             Self.
         """
+        device = t.device(device)
+        # copies to cuda are ordered on the current stream, so they can
+        # be queued without blocking the host
+        non_blocking = device.type == "cuda"
         for ma in self._major_attr:
             ma_data = getattr(self, ma)
             for k, v in ma_data.items():
-                ma_data[k] = v.to(device)
+                if v.device != device:
+                    ma_data[k] = v.to(device, non_blocking=non_blocking)
         for sa in self._sub_attr:
             sa_data = getattr(self, sa)
-            if t.is_tensor(sa_data):
-                object.__setattr__(self, sa, sa_data.to(device))
+            if t.is_tensor(sa_data) and sa_data.device != device:
+                object.__setattr__(self, sa,
+                                   sa_data.to(device,
+                                              non_blocking=non_blocking))
         return self
 
     def _detach(self):
@@ -290,22 +298,24 @@ class TransitionStorageBasic(list):
         Returns:
             The position where transition is inserted.
         """
-        transition = deepcopy(transition)
-        if len(self) == self.max_size:
-            # ring buffer storage
-            position = self.index
-            self[self.index] = transition
-        elif len(self) < self.max_size:
-            # append if not full
-            self.append(transition)
-            position = len(self) - 1
-        else:  # pragma: no cover
-            raise RuntimeError()
-        self.index = (position + 1) % self.max_size
-        return position
+        return self._insert(deepcopy(transition))
 
     def clear(self):
         super(TransitionStorageBasic, self).clear()
+        self.index = 0
+
+    def _insert(self, transition: TransitionBase) -> int:
+        """
+        Insert a transition at the ring buffer index, the list grows
+        until it is full, then the oldest transition is overwritten.
+        """
+        position = self.index
+        if position < len(self):
+            self[position] = transition
+        else:
+            self.append(transition)
+        self.index = (position + 1) % self.max_size
+        return position
 
 
 class TransitionStorageSmart(TransitionStorageBasic):
@@ -327,6 +337,10 @@ class TransitionStorageSmart(TransitionStorageBasic):
 
     def store(self, transition: TransitionBase) -> int:
         # DOC INHERITED
+        # Attributes are only replaced by their copies (or equal tensors)
+        # below, the transition has been validated when it is created,
+        # so the validation in __setitem__ is skipped.
+        set_attr = object.__setattr__
         last_index = (self.index + self.max_size - 1) % self.max_size
         if last_index < len(self):
             last_transition = self[last_index]
@@ -340,33 +354,316 @@ class TransitionStorageSmart(TransitionStorageBasic):
                                     v.shape != last_state[k].shape or
                                     v.dtype != last_state[k].dtype or
                                     not v.equal(last_state[k])):
-                                transition[ma] = deepcopy(transition[ma])
+                                set_attr(transition, ma, deepcopy(state))
                                 break
                         else:
-                            transition[ma] = last_state
+                            set_attr(transition, ma, last_state)
                 else:
-                    transition[ma] = deepcopy(transition[ma])
+                    set_attr(transition, ma, deepcopy(transition[ma]))
         else:
             for ma in transition.major_attr:
-                transition[ma] = deepcopy(transition[ma])
+                set_attr(transition, ma, deepcopy(transition[ma]))
         for sa in transition.sub_attr:
-            transition[sa] = deepcopy(transition[sa])
+            set_attr(transition, sa, deepcopy(transition[sa]))
         for ca in transition.custom_attr:
-            transition[ca] = deepcopy(transition[ca])
-
-        # store transition
-        if len(self) == self.max_size:
-            # ring buffer storage
-            position = self.index
-            self[self.index] = transition
-        elif len(self) < self.max_size:
-            # append if not full
-            self.append(transition)
-            position = len(self) - 1
-        else:  # pragma: no cover
-            raise RuntimeError()
+            set_attr(transition, ca, deepcopy(transition[ca]))
+
+        return self._insert(transition)
+
+    def clear(self):
+        super(TransitionStorageSmart, self).clear()
+
+
+class TransitionStorageColumnar(Sequence):
+    """
+    TransitionStorageColumnar is a size-capped, column oriented (structure
+    of arrays) storage for transitions. Every key of major attributes and
+    every sub attribute is stored in one preallocated tensor of shape
+    ``[max_size, ...]``, custom attributes are stored in plain lists.
+
+    Columns are allocated lazily when the first transition is stored, all
+    following transitions must have the same attributes, and their tensors
+    must have the same shape (excluding the batch dimension) and dtype as
+    the first one. Values are copied into columns, so stored transitions
+    are isolated from the passed in transition object.
+
+    Indexing the storage with an integer returns a :class:`.Transition`
+    whose tensors are views of the columns, use :meth:`gather` to select
+    a batch of rows in one operation. The storage is a ``Sequence``, so
+    functions such as ``random.sample`` also accept it.
+    """
+    def __init__(self, max_size, device="cpu", pin_memory=False):
+        """
+        Args:
+            max_size: Maximum size of the transition storage.
+            device: Device where columns are allocated.
+            pin_memory: Whether to allocate columns and gathered rows in
+                page locked memory, only valid if ``device`` is "cpu" and
+                CUDA is available.
+        """
+        self.max_size = max_size
+        self.device = device
+        self.pin_memory = pin_memory
+        self.index = 0
+        self._size = 0
+        self._keys = None
+        self._major_attr = []
+        self._sub_attr = []
+        self._custom_attr = []
+        self._scalar_attr = set()
+        self._columns = {}
+
+    @property
+    def major_attr(self):
+        return self._major_attr
+
+    @property
+    def sub_attr(self):
+        return self._sub_attr
+
+    @property
+    def custom_attr(self):
+        return self._custom_attr
+
+    @property
+    def sub_scalar_attr(self):
+        """
+        Returns:
+            Names of sub attributes stored from scalars.
+        """
+        return self._scalar_attr
+
+    @property
+    def columns(self):
+        """
+        Returns:
+            A dictionary of columns. Major attributes map to dictionaries of
+            tensors, sub attributes map to tensors, custom attributes map to
+            lists. Only the first ``len(self)`` rows are valid.
+        """
+        return self._columns
+
+    def keys(self):
+        """
+        Returns:
+            Attribute names of stored transitions, ``None`` if the storage
+            has not been allocated.
+        """
+        return self._keys
+
+    def store(self, transition: TransitionBase) -> int:
+        """
+        Args:
+            transition: Transition object to be stored
+
+        Returns:
+            The position where transition is inserted.
+
+        Raises:
+            ``ValueError`` if transition object has different attributes
+            or different tensor shapes or dtypes compared to stored
+            transitions.
+        """
+        if self._keys is None or (self._size == 0 and
+                                  not self._is_compatible(transition)):
+            self._allocate(transition)
+        elif transition.keys() != self._keys:
+            raise ValueError("Transition object has different attributes!")
+
+        # validate everything before writing, a rejected transition must
+        # not overwrite the row (which may hold the oldest transition)
+        for ma in self._major_attr:
+            ma_data = transition[ma]
+            ma_column = self._columns[ma]
+            if ma_data.keys() != ma_column.keys():
+                raise ValueError("Transition object has different attributes!")
+            for k, v in ma_data.items():
+                self._check_tensor(ma_column[k], v, ma, k)
+        for sa in self._sub_attr:
+            sa_data = transition[sa]
+            if sa in self._scalar_attr:
+                if t.is_tensor(sa_data):
+                    raise ValueError('Transition sub attribute "{}" must be '
+                                     'a scalar.'.format(sa))
+            else:
+                if not t.is_tensor(sa_data):
+                    raise ValueError('Transition sub attribute "{}" must be '
+                                     'a tensor.'.format(sa))
+                self._check_tensor(self._columns[sa], sa_data, sa)
+        custom_data = {ca: deepcopy(transition[ca])
+                       for ca in self._custom_attr}
+
+        position = self.index
+        for ma in self._major_attr:
+            ma_column = self._columns[ma]
+            for k, v in transition[ma].items():
+                ma_column[k][position:position + 1].copy_(v)
+        for sa in self._sub_attr:
+            sa_data = transition[sa]
+            if sa in self._scalar_attr:
+                self._promote_scalar_column(sa, sa_data)
+                self._columns[sa][position] = sa_data
+            else:
+                self._columns[sa][position:position + 1].copy_(sa_data)
+        for ca in self._custom_attr:
+            self._columns[ca][position] = custom_data[ca]
+
+        self._size = min(self._size + 1, self.max_size)
         self.index = (position + 1) % self.max_size
         return position
 
+    def gather(self, index: t.Tensor, attr: str, sub_key: str = None):
+        """
+        Select rows of a column.
+
+        Args:
+            index: A 1-D ``LongTensor`` of row indexes, or ``None`` to select
+                all valid rows. If ``None``, returned tensors are views of
+                the column and must not be modified.
+            attr: Attribute name.
+            sub_key: Key of major attribute.
+
+        Returns:
+            A tensor of shape ``[len(index), ...]`` for major and sub
+            attributes, a list for custom attributes.
+        """
+        column = self._columns[attr]
+        if sub_key is not None:
+            column = column[sub_key]
+        if t.is_tensor(column):
+            if index is None:
+                return column[:self._size]
+            index = index.to(column.device)
+            if self.pin_memory:
+                # gather into page locked memory, so the result could be
+                # copied to gpu asynchronously
+                result = t.empty([index.shape[0]] + list(column.shape[1:]),
+                                 dtype=column.dtype, pin_memory=True)
+                return t.index_select(column, 0, index, out=result)
+            return column.index_select(0, index)
+        if index is None:
+            return column[:self._size]
+        return [column[i] for i in index.tolist()]
+
     def clear(self):
-        super(TransitionStorageSmart, self).clear()
+        """
+        Remove all transitions, allocated columns are kept for reuse.
+        """
+        self.index = 0
+        self._size = 0
+        for ca in self._custom_attr:
+            self._columns[ca] = [None] * self.max_size
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def __getitem__(self, item: int) -> Transition:
+        if item < 0:
+            item += self._size
+        if not 0 <= item < self._size:
+            raise IndexError("Transition storage index out of range")
+        data = {}
+        for ma in self._major_attr:
+            data[ma] = {k: v[item:item + 1]
+                        for k, v in self._columns[ma].items()}
+        for sa in self._sub_attr:
+            if sa in self._scalar_attr:
+                data[sa] = self._columns[sa][item].item()
+            else:
+                data[sa] = self._columns[sa][item:item + 1]
+        for ca in self._custom_attr:
+            data[ca] = self._columns[ca][item]
+        return Transition(**data)
+
+    def _allocate(self, transition: TransitionBase):
+        self.index = 0
+        self._size = 0
+        self._keys = list(transition.keys())
+        self._major_attr = list(transition.major_attr)
+        self._sub_attr = list(transition.sub_attr)
+        self._custom_attr = list(transition.custom_attr)
+        self._scalar_attr = set()
+        self._columns = {}
+        for ma in self._major_attr:
+            self._columns[ma] = {k: self._empty(v.shape[1:], v.dtype)
+                                 for k, v in transition[ma].items()}
+        for sa in self._sub_attr:
+            sa_data = transition[sa]
+            if t.is_tensor(sa_data):
+                self._columns[sa] = self._empty(sa_data.shape[1:],
+                                                sa_data.dtype)
+            else:
+                self._scalar_attr.add(sa)
+                self._columns[sa] = self._empty(
+                    [1], self._scalar_dtype(sa_data)
+                )
+        for ca in self._custom_attr:
+            self._columns[ca] = [None] * self.max_size
+
+    def _is_compatible(self, transition: TransitionBase):
+        if transition.keys() != self._keys:
+            return False
+        for ma in self._major_attr:
+            ma_data = transition[ma]
+            ma_column = self._columns[ma]
+            if ma_data.keys() != ma_column.keys():
+                return False
+            for k, v in ma_data.items():
+                if (v.shape[1:] != ma_column[k].shape[1:] or
+                        v.dtype != ma_column[k].dtype):
+                    return False
+        for sa in self._sub_attr:
+            sa_data = transition[sa]
+            if t.is_tensor(sa_data) == (sa in self._scalar_attr):
+                return False
+            if t.is_tensor(sa_data) and (
+                    sa_data.shape[1:] != self._columns[sa].shape[1:] or
+                    sa_data.dtype != self._columns[sa].dtype):
+                return False
+        return True
+
+    def _empty(self, shape, dtype):
+        return t.empty([self.max_size] + list(shape),
+                       dtype=dtype, device=self.device,
+                       pin_memory=self.pin_memory)
+
+    def _promote_scalar_column(self, attr: str, value: Scalar):
+        # e.g.: reward is an int in the first transition, and a float
+        # in the following transitions.
+        column = self._columns[attr]
+        dtype = t.promote_types(column.dtype, self._scalar_dtype(value))
+        if dtype != column.dtype:
+            column = column.to(dtype)
+            self._columns[attr] = (column.pin_memory()
+                                   if self.pin_memory
+                                   else column)
+
+    @staticmethod
+    def _scalar_dtype(value: Scalar):
+        if isinstance(value, (bool, np.bool_)):
+            return t.bool
+        elif isinstance(value, (int, np.integer)):
+            return t.long
+        else:
+            return t.get_default_dtype()
+
+    @staticmethod
+    def _check_tensor(column: t.Tensor, value: t.Tensor,
+                      attr: str, sub_key: str = None):
+        # copy_ would silently cast values of a different dtype,
+        # eg: truncate float actions stored in a long column
+        name = ('Key "{}" of transition major attribute "{}"'
+                .format(sub_key, attr)
+                if sub_key is not None
+                else 'Transition sub attribute "{}"'.format(attr))
+        if value.shape[1:] != column.shape[1:]:
+            raise ValueError("{} has shape {}, but stored shape is {}."
+                             .format(name, list(value.shape[1:]),
+                                     list(column.shape[1:])))
+        if value.dtype != column.dtype:
+            raise ValueError("{} has dtype {}, but stored dtype is {}."
+                             .format(name, value.dtype, column.dtype))
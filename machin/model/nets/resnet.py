@@ -1,7 +1,7 @@
 import torch as t
-import numpy as np
 import torch.nn as nn
 from torch.nn.utils.weight_norm import weight_norm
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 
 from .base import NeuralNetworkModule
 
@@ -34,6 +34,29 @@ def none_norm(*_, **__):
     return nn.Sequential()
 
 
+def fuse_conv_bn(conv, bn):
+    """
+    Fold a batch normalization layer into its preceding convolution layer.
+
+    Returns:
+        The fused convolution layer and an identity layer, or the original
+        layers if ``bn`` is not a batch normalization layer.
+    """
+    if not isinstance(bn, nn.BatchNorm2d):
+        return conv, bn
+    return fuse_conv_bn_eval(conv, bn), nn.Identity()
+
+
+def fuse_shortcut(shortcut):
+    """
+    Fold the batch normalization layer of a shortcut into its convolution.
+    """
+    if len(shortcut) == 2:
+        conv, bn = fuse_conv_bn(shortcut[0], shortcut[1])
+        return nn.Sequential(conv, bn)
+    return shortcut
+
+
 def cfg(depth, norm="none"):
     depth_lst = [18, 34, 50, 101, 152]
     if depth not in depth_lst:
@@ -103,10 +126,19 @@ class BasicBlock(NeuralNetworkModule):
                 norm_layer(self.expansion * out_planes)
             )
 
+    def fuse_for_inference(self):
+        """
+        Fold batch normalization layers into convolution layers.
+        """
+        self.conv1, self.bn1 = fuse_conv_bn(self.conv1, self.bn1)
+        self.conv2, self.bn2 = fuse_conv_bn(self.conv2, self.bn2)
+        self.shortcut = fuse_shortcut(self.shortcut)
+        self.set_input_module(self.conv1)
+
     def forward(self, x):
         out = t.relu(self.bn1(self.conv1(x)))
         out = self.bn2(self.conv2(out))
-        out += self.shortcut(x)
+        out = out + self.shortcut(x)
         out = t.relu(out)
         return out
 
@@ -144,11 +176,21 @@ class Bottleneck(NeuralNetworkModule):
                 norm_layer(self.expansion * out_planes)
             )
 
+    def fuse_for_inference(self):
+        """
+        Fold batch normalization layers into convolution layers.
+        """
+        self.conv1, self.bn1 = fuse_conv_bn(self.conv1, self.bn1)
+        self.conv2, self.bn2 = fuse_conv_bn(self.conv2, self.bn2)
+        self.conv3, self.bn3 = fuse_conv_bn(self.conv3, self.bn3)
+        self.shortcut = fuse_shortcut(self.shortcut)
+        self.set_input_module(self.conv1)
+
     def forward(self, x):
         out = t.relu(self.bn1(self.conv1(x)))
         out = t.relu(self.bn2(self.conv2(out)))
         out = self.bn3(self.conv3(out))
-        out += self.shortcut(x)
+        out = out + self.shortcut(x)
         out = t.relu(out)
         return out
 
@@ -190,7 +232,7 @@ class BasicBlockWN(NeuralNetworkModule):
     def forward(self, x):
         out = t.relu(self.conv1(x))
         out = self.conv2(out)
-        out += self.shortcut(x)
+        out = out + self.shortcut(x)
         out = t.relu(out)
         return out
 
@@ -235,7 +277,7 @@ class BottleneckWN(NeuralNetworkModule):
         out = t.relu(self.conv1(x))
         out = t.relu(self.conv2(out))
         out = self.conv3(out)
-        out += self.shortcut(x)
+        out = out + self.shortcut(x)
         out = t.relu(out)
 
         return out
@@ -247,7 +289,11 @@ class ResNet(NeuralNetworkModule):
                  depth: int,
                  out_planes: int,
                  out_pool_size=(1, 1),
-                 norm="none"):
+                 norm="none",
+                 use_torch_compile=False,
+                 allow_tf32=False,
+                 autocast_dtype=None,
+                 channels_last=False):
         """
         Create a resnet of specified depth.
 
@@ -258,6 +304,20 @@ class ResNet(NeuralNetworkModule):
             out_pool_size: Size of pooling output
             norm: Normalization method, could be one of "none", "batch" or
                 "weight".
+            use_torch_compile: Whether to compile the convolution layers
+                with ``torch.compile``, so that element-wise operations
+                such as the residual add and relu could be fused.
+                Requires pytorch >= 2.2.
+            allow_tf32: Whether to allow TF32 tensor cores in cuda matmul
+                and cudnn convolutions. Note: this is a process wide
+                setting of ``torch.backends``, it affects other models too.
+            autocast_dtype: If set, ``forward`` will run in
+                ``torch.autocast`` with this dtype (eg: ``torch.float16``,
+                ``torch.bfloat16``), output is cast back to the input dtype.
+            channels_last: Whether to store convolution weights and
+                activations in the ``torch.channels_last`` (NHWC) memory
+                format, which is faster on tensor core gpus. Inputs should
+                already be NHWC contiguous to avoid a copy in ``forward``.
         """
         super(ResNet, self).__init__()
         self.norm = norm
@@ -265,6 +325,12 @@ class ResNet(NeuralNetworkModule):
         self.in_planes = in_planes
         self.out_planes = out_planes
         self.out_pool_size = out_pool_size
+        self.autocast_dtype = autocast_dtype
+        self.channels_last = channels_last
+
+        if allow_tf32:
+            t.backends.cuda.matmul.allow_tf32 = True
+            t.backends.cudnn.allow_tf32 = True
 
         self._cur_in_planes = 64
 
@@ -297,6 +363,46 @@ class ResNet(NeuralNetworkModule):
 
         self.set_input_module(self.conv1)
 
+        if channels_last:
+            self.to(memory_format=t.channels_last)
+
+        if use_torch_compile:
+            if not hasattr(nn.Module, "compile"):
+                raise RuntimeError("use_torch_compile requires pytorch >= 2.2")
+            # compile in place, keys of the state dict are not changed
+            self.base.compile()
+
+    def fuse_for_inference(self):
+        """
+        Fold all batch normalization layers into their preceding convolution
+        layers, so that each of them is evaluated as a single convolution.
+        Only has effect if ``norm`` is "batch".
+
+        Warning:
+            The fused network is only meant for inference, it should not be
+            trained anymore, its state dict keys are also changed.
+
+        Returns:
+            Self.
+
+        Raises:
+            ``RuntimeError`` if the network is in training mode.
+        """
+        if self.training:
+            raise RuntimeError("Network must be in evaluation mode, "
+                               "call eval() before fusing.")
+        if self.norm != "batch":
+            return self
+        self.conv1, self.bn1 = fuse_conv_bn(self.conv1, self.bn1)
+        self.base[0], self.base[1] = self.conv1, self.bn1
+        self.set_input_module(self.conv1)
+        for module in list(self.modules()):
+            if isinstance(module, (BasicBlock, Bottleneck)):
+                module.fuse_for_inference()
+        if self.channels_last:
+            self.to(memory_format=t.channels_last)
+        return self
+
     def _make_layer(self, block, planes, num_blocks, stride, kwargs):
         strides = [stride] + [1] * (num_blocks - 1)
         layers = []
@@ -309,10 +415,17 @@ class ResNet(NeuralNetworkModule):
 
     def forward(self, x):
         assert x.shape[2] == 224 and x.shape[3] == 224
+        if self.autocast_dtype is None:
+            return self._forward(x)
+        with t.autocast(x.device.type, dtype=self.autocast_dtype):
+            return self._forward(x).to(x.dtype)
+
+    def _forward(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=t.channels_last)
         x = self.base(x)
-        kernel_size = (np.int(np.floor(x.size(2) / self.out_pool_size[0])),
-                       np.int(np.floor(x.size(3) / self.out_pool_size[1])))
-        x = nn.functional.avg_pool2d(x, kernel_size)
-        x = x.view(x.size(0), -1)
+        x = nn.functional.adaptive_avg_pool2d(x, self.out_pool_size)
+        # pooled output is not contiguous in the channels last format
+        x = x.reshape(x.size(0), -1)
         x = self.fc(x)
         return x
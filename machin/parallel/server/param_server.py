@@ -1,4 +1,4 @@
-from typing import Any, Union, List
+from typing import Any, Union, List, Dict
 from random import choice
 from copy import deepcopy
 from queue import Queue
@@ -7,6 +7,7 @@ from threading import Event
 import enum
 import torch as t
 import torch.nn as nn
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 
 from machin.parallel.thread import Thread
 from machin.parallel.distributed import RpcGroup
@@ -18,6 +19,85 @@ from .ordered_server import (
 )
 
 
+def _bucket_tensors(tensors: List[t.Tensor],
+                    bucket_cap_mb: float) -> List[List[int]]:
+    """
+    Split tensors into buckets in reverse order, which is the order
+    gradients are produced during backward. A new bucket is started
+    if the current bucket will exceed ``bucket_cap_mb`` megabytes, or
+    if tensor dtype changes.
+
+    Returns:
+        Indexes of tensors in each bucket.
+    """
+    cap = bucket_cap_mb * 1024 * 1024
+    buckets = []
+    bucket, bucket_bytes, bucket_dtype = [], 0, None
+    for i in reversed(range(len(tensors))):
+        size = tensors[i].numel() * tensors[i].element_size()
+        if bucket and (tensors[i].dtype != bucket_dtype or
+                       bucket_bytes + size > cap):
+            buckets.append(bucket)
+            bucket, bucket_bytes = [], 0
+        bucket.append(i)
+        bucket_bytes += size
+        bucket_dtype = tensors[i].dtype
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
+def _flatten_buckets(tensors: List[t.Tensor],
+                     bucket_cap_mb: float) -> List[t.Tensor]:
+    """
+    Flatten tensors into a few contiguous cpu tensors, one per bucket.
+    Results never share storage with ``tensors``.
+    """
+    result = []
+    for bucket in _bucket_tensors(tensors, bucket_cap_mb):
+        flat = _flatten_dense_tensors([tensors[i] for i in bucket])
+        if len(bucket) == 1:
+            # a single tensor is flattened to a view of itself
+            flat = flat.clone()
+        result.append(flat.to("cpu"))
+    return result
+
+
+def _unflatten_buckets(flat_buckets: List[t.Tensor],
+                       tensors: List[t.Tensor],
+                       bucket_cap_mb: float) -> List[t.Tensor]:
+    """
+    Inverse of :func:`_flatten_buckets`, ``tensors`` provide the
+    layout (shape and dtype) of flattened tensors.
+
+    Returns:
+        Unflattened tensors, in the same order as ``tensors``.
+
+    Raises:
+        ``ValueError`` if ``flat_buckets`` does not match the bucket
+        layout of ``tensors``.
+    """
+    buckets = _bucket_tensors(tensors, bucket_cap_mb)
+    if len(flat_buckets) != len(buckets):
+        raise ValueError("Expect {} buckets for {} local tensors, got {}, "
+                         "make sure models and bucket_cap_mb are the same "
+                         "on all processes."
+                         .format(len(buckets), len(tensors),
+                                 len(flat_buckets)))
+    result = [None] * len(tensors)
+    for idx, (flat, bucket) in enumerate(zip(flat_buckets, buckets)):
+        numel = sum(tensors[i].numel() for i in bucket)
+        if flat.numel() != numel:
+            raise ValueError("Bucket {} has {} elements, expect {} for "
+                             "local tensors {}, make sure models and "
+                             "bucket_cap_mb are the same on all processes."
+                             .format(idx, flat.numel(), numel, bucket))
+        unflat = _unflatten_dense_tensors(flat, [tensors[i] for i in bucket])
+        for i, tensor in zip(bucket, unflat):
+            result[i] = tensor
+    return result
+
+
 class PushPullModelServer:
     def __init__(self,
                  model_name: str,
@@ -143,10 +223,16 @@ class PushPullGradServer:
                  group: RpcGroup,
                  model_name: str,
                  secondary_reducers: List[str],
-                 o_server: OrderedServerBase):
+                 o_server: OrderedServerBase,
+                 bucket_cap_mb: float = 25,
+                 compress_dtype: t.dtype = None):
         self.group = group
         self.model_name = model_name
         self.o_server = o_server
+        self.bucket_cap_mb = bucket_cap_mb
+        self.compress_dtype = compress_dtype
+        # error feedback of compressed gradients, indexed by bucket
+        self._grad_residuals = {}  # type: Dict[int, t.Tensor]
         self.secondary_services = [server_name +
                                    "/" + m + "/_push_service"
                                    for m in secondary_reducers]
@@ -156,22 +242,59 @@ class PushPullGradServer:
         Push the gradients of your model, then pull the newest parameters.
          Its gradients will be cleared.
 
+        Note:
+            Gradients are flattened into buckets of at most
+            ``bucket_cap_mb`` megabytes, so only a few large tensors are
+            transmitted and reduced. If ``compress_dtype`` is set,
+            floating point buckets are cast to it before being pushed, the
+            rounding error is kept locally and added to the next push.
+
         Args:
             model: Model to push.
         """
+        future = self.push_async(model)
+        self.pull(model)
+        future.wait()
+
+    def push_async(self, model: nn.Module):
+        """
+        Push the gradients of your model without waiting for the
+        reducer, gradients are copied before returning, so you may
+        :meth:`pull` or modify your model right after this call.
+
+        Args:
+            model: Model to push.
+
+        Returns:
+            A future object you can call ``wait()`` on.
+        """
         # extract gradients from the model
-        grad_dict = {}
+        grads = []
         for k, v in model.named_parameters():
             if not hasattr(v, "grad") or \
                     not t.is_tensor(v.grad):  # pragma: no cover
                 raise RuntimeError("Parameter {} doesn't have gradient "
                                    "to push!".format(k))
-            grad_dict[k] = deepcopy(v.grad).to("cpu")
-        self.group.registered_sync(
+            grads.append(v.grad)
+        flat_grads = _flatten_buckets(grads, self.bucket_cap_mb)
+        if self.compress_dtype is not None:
+            flat_grads = [self._compress(i, g)
+                          for i, g in enumerate(flat_grads)]
+        grad_dict = dict(enumerate(flat_grads))
+        return self.group.registered_async(
             choice(self.secondary_services),
             args=(grad_dict, ReduceType.REDUCE_SECONDARY)
         )
-        self.pull(model)
+
+    def _compress(self, idx: int, grad: t.Tensor):
+        if not grad.is_floating_point() or grad.dtype == self.compress_dtype:
+            return grad
+        residual = self._grad_residuals.get(idx, None)
+        if residual is not None and residual.shape == grad.shape:
+            grad = grad + residual
+        compressed = grad.to(self.compress_dtype)
+        self._grad_residuals[idx] = grad - compressed.to(grad.dtype)
+        return compressed
 
     def pull(self, model: nn.Module):
         """
@@ -179,13 +302,21 @@ class PushPullGradServer:
 
         Args:
             model: Model to push.
+
+        Raises:
+            ``ValueError`` if pulled parameters do not match the layout
+            of ``model``.
         """
         model.zero_grad()
         params = self.o_server.pull(self.model_name)
         if params is not None:
             # params could be None if the master reducer has't performed
             # a single reduction operation yet
-            prep_load_state_dict(model, params[0])
+            state_dict = model.state_dict()
+            values = _unflatten_buckets(params[0],
+                                        list(state_dict.values()),
+                                        self.bucket_cap_mb)
+            prep_load_state_dict(model, dict(zip(state_dict.keys(), values)))
 
 
 class PushPullGradServerImpl:
@@ -211,7 +342,9 @@ class PushPullGradServerImpl:
                  reduce_method: str = "sum",
                  reduce_device: Union[t.device, str] = "cpu",
                  reduce_batch_size: int = 4,
-                 max_queue_size: int = 64):
+                 max_queue_size: int = 64,
+                 bucket_cap_mb: float = 25,
+                 compress_dtype: t.dtype = None):
         """
         Note:
             You should initialize ``PushPullGradServer`` on all members of
@@ -259,10 +392,19 @@ class PushPullGradServerImpl:
                 wait until the number of requests in the reduction queue have
                 reached this size.
             max_queue_size: Maximum reduction request queue size.
+            bucket_cap_mb: Gradients and parameters are flattened into
+                buckets of at most this size (in megabytes) before they
+                are transmitted.
+            compress_dtype: If set (eg: ``torch.bfloat16``), gradients are
+                cast to this dtype before being pushed, reduction is
+                performed in float32, and optimization is still performed
+                in the parameter dtype.
         """
         self.server_name = server_name
         self.group = group
         self.model_name = model_name
+        self.bucket_cap_mb = bucket_cap_mb
+        self.compress_dtype = compress_dtype
 
         if primary_reducer is None:
             primary_reducer = group.get_group_members()[0]
@@ -304,7 +446,9 @@ class PushPullGradServerImpl:
                 PushPullGradServer(self.server_name, self.group,
                                    self.model_name,
                                    self.secondary_reducers,
-                                   self.o_server)
+                                   self.o_server,
+                                   self.bucket_cap_mb,
+                                   self.compress_dtype)
             )
 
         # prepare to start the reduction sub-thread
@@ -403,12 +547,21 @@ class PushPullGradServerImpl:
                 # perform optimization.
                 if self.model is not None and self.optimizer is not None:
                     self.optimizer.zero_grad()
+                    params = list(self.model.parameters())
+                    grads = _unflatten_buckets(
+                        [grad_dict[i] for i in range(len(grad_dict))],
+                        params, self.bucket_cap_mb
+                    )
                     with t.no_grad():
-                        for k, v in self.model.named_parameters():
-                            v.grad = grad_dict[k].to(v.device)
+                        for v, grad in zip(params, grads):
+                            v.grad = grad.to(device=v.device, dtype=v.dtype)
                     self.optimizer.step()
+                    state_dict = self.model.to("cpu").state_dict()
                     self.o_server.push(self.model_name,
-                                       self.model.to("cpu").state_dict(),
+                                       _flatten_buckets(
+                                           list(state_dict.values()),
+                                           self.bucket_cap_mb
+                                       ),
                                        self.model.pp_version + 1,
                                        self.model.pp_version)
                     self.model.pp_version += 1
@@ -447,10 +600,17 @@ class PushPullGradServerImpl:
                     grad_dict[k].append(v.to(reduce_device))
         for k, v in grad_dict.items():
             # Stack parameter tensors in dim 0 and reduce.
+            # Compressed (half precision) gradients are reduced in float,
+            # and kept in float, so the primary reducer does not round
+            # partial results again, they are only cast to the parameter
+            # dtype when assigned to the managed model.
+            stacked = t.stack(v, dim=0)
+            if stacked.dtype in (t.float16, t.bfloat16):
+                stacked = stacked.float()
             if reduce_method == "sum":
-                grad_dict[k] = t.sum(t.stack(v, dim=0), dim=0, keepdim=False)
+                grad_dict[k] = t.sum(stacked, dim=0, keepdim=False)
             elif reduce_method == "mean":
-                grad_dict[k] = t.mean(t.stack(v, dim=0), dim=0, keepdim=False)
+                grad_dict[k] = t.mean(stacked, dim=0, keepdim=False)
             else:  # pragma: no cover
                 raise RuntimeError("Unknown reduce method.")
         return grad_dict
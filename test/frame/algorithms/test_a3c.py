@@ -4,14 +4,18 @@ from machin.frame.helpers.servers import grad_server_helper
 from machin.utils.helper_classes import Counter
 from machin.utils.conf import Config
 from machin.env.utils.openai_gym import disable_view_window
-from torch.distributions import Categorical
 
 import os
 import torch as t
 import torch.nn as nn
-import gym
 
-from .utils import unwrap_time_limit, Smooth
+from .utils import (
+    make_vector_env,
+    obs_to_tensor,
+    make_episode,
+    maybe_compile,
+    inference_mode
+)
 from test.util_run_multi import *
 
 
@@ -19,20 +23,24 @@ class Actor(nn.Module):
     def __init__(self, state_dim, action_num):
         super(Actor, self).__init__()
 
-        self.fc1 = nn.Linear(state_dim, 16)
-        self.fc2 = nn.Linear(16, 16)
+        # relu could overwrite outputs of linear layers in place
+        self.trunk = nn.Sequential(nn.Linear(state_dim, 16),
+                                   nn.ReLU(inplace=True),
+                                   nn.Linear(16, 16),
+                                   nn.ReLU(inplace=True))
         self.fc3 = nn.Linear(16, action_num)
 
     def forward(self, state, action=None):
-        a = t.relu(self.fc1(state))
-        a = t.relu(self.fc2(a))
-        probs = t.softmax(self.fc3(a), dim=1)
-        dist = Categorical(probs=probs)
+        a = self.trunk(state)
+        # same as Categorical, without its python side checks,
+        # which cause graph breaks in torch.compile
+        log_probs = t.log_softmax(self.fc3(a), dim=1)
+        probs = log_probs.exp()
         act = (action
                if action is not None
-               else dist.sample())
-        act_entropy = dist.entropy()
-        act_log_prob = dist.log_prob(act.flatten())
+               else t.multinomial(probs, 1))
+        act_entropy = -(probs * log_probs).sum(dim=1)
+        act_log_prob = log_probs.gather(1, act.long().view(-1, 1)).view(-1)
         return act, act_log_prob, act_entropy
 
 
@@ -40,26 +48,26 @@ class Critic(nn.Module):
     def __init__(self, state_dim):
         super(Critic, self).__init__()
 
-        self.fc1 = nn.Linear(state_dim, 16)
-        self.fc2 = nn.Linear(16, 16)
+        self.trunk = nn.Sequential(nn.Linear(state_dim, 16),
+                                   nn.ReLU(inplace=True),
+                                   nn.Linear(16, 16),
+                                   nn.ReLU(inplace=True))
         self.fc3 = nn.Linear(16, 1)
 
     def forward(self, state):
-        v = t.relu(self.fc1(state))
-        v = t.relu(self.fc2(v))
+        v = self.trunk(state)
         v = self.fc3(v)
         return v
 
 
 class TestA3C(object):
     # configs and definitions
-    disable_view_window()
     c = Config()
     # Note: online policy algorithms such as PPO and A3C does not
     # work well in Pendulum (reason unknown)
     # and MountainCarContinuous (sparse returns)
     c.env_name = "CartPole-v0"
-    c.env = unwrap_time_limit(gym.make(c.env_name))
+    c.env_num = 8
     c.observe_dim = 4
     c.action_num = 2
     c.max_episodes = 3000
@@ -67,14 +75,28 @@ class TestA3C(object):
     c.replay_size = 10000
     c.solved_reward = 190
     c.solved_repeat = 5
+    c.use_torch_compile = False
+
+    @staticmethod
+    def get_env():
+        # environments are only created in processes using them,
+        # since disable_view_window imports the renderer
+        c = TestA3C.c
+        disable_view_window()
+        return make_vector_env(c.env_name, c.env_num)
 
     @staticmethod
     def a3c():
         c = TestA3C.c
+        # A3C workers are separate processes, limit each of them to one
+        # compute thread so they do not oversubscribe cpu cores
+        t.set_num_threads(1)
         actor = smw(Actor(c.observe_dim, c.action_num)
                     .to(c.device), c.device, c.device)
         critic = smw(Critic(c.observe_dim)
                      .to(c.device), c.device, c.device)
+        actor = maybe_compile(actor, c.use_torch_compile)
+        critic = maybe_compile(critic, c.use_torch_compile)
         # in all test scenarios, all processes will be used as reducers
         servers = grad_server_helper(
             [lambda: Actor(c.observe_dim, c.action_num),
@@ -104,6 +126,45 @@ class TestA3C(object):
         a3c.act({"state": state})
         return True
 
+    ########################################################################
+    # Test for A3C acting with a pull interval
+    ########################################################################
+    @staticmethod
+    @run_multi(expected_results=[True, True, True],
+               pass_through=["gpu"],
+               timeout=180)
+    @WorldTestBase.setup_world
+    def test_act_pull_interval(_, gpu):
+        c = TestA3C.c
+        c.device = gpu
+        a3c = TestA3C.a3c()
+        a3c.pull_interval = 4
+        pull_count = Counter()
+        org_pull = a3c.actor_grad_server.pull
+
+        def pull(model):
+            pull_count.count()
+            org_pull(model)
+
+        a3c.actor_grad_server.pull = pull
+        state = t.zeros([1, c.observe_dim])
+        for _ in range(8):
+            a3c.act({"state": state})
+        assert pull_count.get() == 2
+        a3c.start_rollout()
+        a3c.act({"state": state})
+        assert pull_count.get() == 3
+        # parameters pulled by manual_sync are used for exactly
+        # pull_interval acts
+        a3c.manual_sync()
+        assert pull_count.get() == 4
+        for _ in range(4):
+            a3c.act({"state": state})
+        assert pull_count.get() == 4
+        a3c.act({"state": state})
+        assert pull_count.get() == 5
+        return True
+
     ########################################################################
     # Test for A3C action evaluation
     ########################################################################
@@ -155,21 +216,20 @@ class TestA3C(object):
         c.device = gpu
         a3c = TestA3C.a3c()
         old_state = state = t.zeros([1, c.observe_dim])
-        action = t.zeros([1, 1], dtype=t.int)
+        action = t.zeros([1, 1], dtype=t.uint8)
+        # store_episode writes "value" and "gae" into each transition, they
+        # depend on its position in the episode, so dicts are not shared
+        transition = {"state": {"state": old_state},
+                      "action": {"action": action},
+                      "next_state": {"state": state},
+                      "reward": 0,
+                      "terminal": False}
 
         begin = time()
         while time() - begin < 5:
-            a3c.store_episode([
-                {"state": {"state": old_state},
-                 "action": {"action": action},
-                 "next_state": {"state": state},
-                 "reward": 0,
-                 "terminal": False}
-                for _ in range(3)
-            ])
+            a3c.store_episode([dict(transition) for _ in range(3)])
             a3c.update(update_value=True, update_policy=True,
                        update_target=True, concatenate_samples=True)
-            sleep(0.01)
 
         if rank == 1:
             # pull the newest model
@@ -202,59 +262,74 @@ class TestA3C(object):
         a3c.set_sync(False)
 
         # begin training
-        episode, step = Counter(), Counter()
-        reward_fulfilled = Counter()
-        smoother = Smooth()
-        terminal = False
-
-        env = c.env
+        # total rewards are smoothed with the same rate as Smooth
+        episode = 0
+        reward_fulfilled = 0
+        smoothed_reward = None
+
+        # step all environments together, each one of them has its own
+        # episode, which is stored and used to update as soon as it
+        # terminates or is truncated, so an update is performed for every
+        # finished sub environment, not once per vector step
+        env = TestA3C.get_env()
+        states = [[] for _ in range(c.env_num)]
+        actions = [[] for _ in range(c.env_num)]
+        rewards = [[] for _ in range(c.env_num)]
         # for cpu usage viewing
-        default_logger.info("{}, pid {}".format(rank, os.getpid()))
-        while episode < c.max_episodes:
-            episode.count()
-
-            # batch size = 1
-            total_reward = 0
-            state = t.tensor(env.reset(), dtype=t.float32, device=c.device)
-
+        default_logger.info("%s, pid %s", rank, os.getpid())
+        try:
+            state = obs_to_tensor(env.reset(), c.device)
             a3c.manual_sync()
-            tmp_observations = []
-            while not terminal and step <= c.max_steps:
-                step.count()
-                with t.no_grad():
-                    old_state = state
-                    # agent model inference
-                    action = a3c.act({"state": old_state.unsqueeze(0)})[0]
-                    state, reward, terminal, _ = env.step(action.item())
-                    state = t.tensor(state, dtype=t.float32, device=c.device) \
-                        .flatten()
-                    total_reward += float(reward)
-
-                    tmp_observations.append({
-                        "state": {"state": old_state.unsqueeze(0)},
-                        "action": {"action": action},
-                        "next_state": {"state": state.unsqueeze(0)},
-                        "reward": float(reward),
-                        "terminal": terminal or step == c.max_steps
-                    })
-
-            # update
-            a3c.store_episode(tmp_observations)
-            a3c.update()
-
-            smoother.update(total_reward)
-            step.reset()
-            terminal = False
-
-            default_logger.info("Process {} Episode {} total reward={:.2f}"
-                                .format(rank, episode, smoother.value))
-
-            if smoother.value > c.solved_reward:
-                reward_fulfilled.count()
-                if reward_fulfilled >= c.solved_repeat:
-                    default_logger.info("Environment solved!")
-                    return True
-            else:
-                reward_fulfilled.reset()
-
-        raise RuntimeError("A3C Training failed.")
+            while episode < c.max_episodes:
+                old_state = state
+                # agent model inference, observations are created outside,
+                # since they are used by the critic in store_episode
+                with inference_mode():
+                    action = a3c.act({"state": old_state})[0]
+                state, reward, terminal, _ = \
+                    env.step(action.view(-1).cpu().numpy())
+                state = obs_to_tensor(state, c.device)
+                # two actions, store them compactly in the replay buffer,
+                # the actor casts them to long when evaluating
+                stored_action = action.to(t.uint8)
+
+                for i in range(c.env_num):
+                    states[i].append(old_state[i:i + 1])
+                    actions[i].append(stored_action[i:i + 1])
+                    rewards[i].append(float(reward[i]))
+                    if not terminal[i] and len(rewards[i]) < c.max_steps:
+                        continue
+
+                    # update
+                    episode += 1
+                    a3c.store_episode(make_episode(states[i], actions[i],
+                                                   rewards[i], state[i:i + 1]))
+                    a3c.update()
+
+                    total_reward = sum(rewards[i])
+                    smoothed_reward = (total_reward
+                                       if smoothed_reward is None
+                                       else smoothed_reward * 0.8
+                                       + total_reward * 0.2)
+                    states[i], actions[i], rewards[i] = [], [], []
+                    if not terminal[i]:
+                        # truncated by max_steps, vector environments only
+                        # reset terminated sub environments automatically
+                        state[i] = obs_to_tensor(env.envs[i].reset(), c.device)
+
+                    # formatted only if the message is emitted
+                    default_logger.info("Process %s Episode %d "
+                                        "total reward=%.2f",
+                                        rank, episode, smoothed_reward)
+
+                    if smoothed_reward > c.solved_reward:
+                        reward_fulfilled += 1
+                        if reward_fulfilled >= c.solved_repeat:
+                            default_logger.info("Environment solved!")
+                            return True
+                    else:
+                        reward_fulfilled = 0
+
+            raise RuntimeError("A3C Training failed.")
+        finally:
+            env.close()
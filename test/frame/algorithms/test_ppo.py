@@ -1,17 +1,22 @@
 from machin.model.nets.base import static_module_wrapper as smw
 from machin.frame.algorithms.ppo import PPO
 from machin.utils.logging import default_logger as logger
-from machin.utils.helper_classes import Counter
 from machin.utils.conf import Config
 from machin.env.utils.openai_gym import disable_view_window
-from torch.distributions import Categorical
+
+from copy import deepcopy
 
 import pytest
 import torch as t
 import torch.nn as nn
-import gym
 
-from .utils import unwrap_time_limit, Smooth
+from .utils import (
+    make_vector_env,
+    obs_to_tensor,
+    make_episode,
+    maybe_compile,
+    inference_mode
+)
 from test.util_run_multi import gpu
 
 
@@ -19,20 +24,24 @@ class Actor(nn.Module):
     def __init__(self, state_dim, action_num):
         super(Actor, self).__init__()
 
-        self.fc1 = nn.Linear(state_dim, 16)
-        self.fc2 = nn.Linear(16, 16)
+        # relu could overwrite outputs of linear layers in place
+        self.trunk = nn.Sequential(nn.Linear(state_dim, 16),
+                                   nn.ReLU(inplace=True),
+                                   nn.Linear(16, 16),
+                                   nn.ReLU(inplace=True))
         self.fc3 = nn.Linear(16, action_num)
 
     def forward(self, state, action=None):
-        a = t.relu(self.fc1(state))
-        a = t.relu(self.fc2(a))
-        probs = t.softmax(self.fc3(a), dim=1)
-        dist = Categorical(probs=probs)
+        a = self.trunk(state)
+        # same as Categorical, without its python side checks,
+        # which cause graph breaks in torch.compile
+        log_probs = t.log_softmax(self.fc3(a), dim=1)
+        probs = log_probs.exp()
         act = (action
                if action is not None
-               else dist.sample())
-        act_entropy = dist.entropy()
-        act_log_prob = dist.log_prob(act.flatten())
+               else t.multinomial(probs, 1))
+        act_entropy = -(probs * log_probs).sum(dim=1)
+        act_log_prob = log_probs.gather(1, act.long().view(-1, 1)).view(-1)
         return act, act_log_prob, act_entropy
 
 
@@ -40,13 +49,14 @@ class Critic(nn.Module):
     def __init__(self, state_dim):
         super(Critic, self).__init__()
 
-        self.fc1 = nn.Linear(state_dim, 32)
-        self.fc2 = nn.Linear(32, 32)
+        self.trunk = nn.Sequential(nn.Linear(state_dim, 32),
+                                   nn.ReLU(inplace=True),
+                                   nn.Linear(32, 32),
+                                   nn.ReLU(inplace=True))
         self.fc3 = nn.Linear(32, 1)
 
     def forward(self, state):
-        v = t.relu(self.fc1(state))
-        v = t.relu(self.fc2(v))
+        v = self.trunk(state)
         v = self.fc3(v)
         return v
 
@@ -55,13 +65,12 @@ class TestPPO(object):
     # configs and definitions
     @pytest.fixture(scope="class")
     def train_config(self, gpu):
-        disable_view_window()
         c = Config()
         # Note: online policy algorithms such as PPO and A2C does not
         # work well in Pendulum (reason unknown)
         # and MountainCarContinuous (sparse returns)
         c.env_name = "CartPole-v0"
-        c.env = unwrap_time_limit(gym.make(c.env_name))
+        c.env_num = 8
         c.observe_dim = 4
         c.action_num = 2
         c.max_episodes = 1000
@@ -70,20 +79,50 @@ class TestPPO(object):
         c.solved_reward = 190
         c.solved_repeat = 5
         c.device = gpu
+        c.use_torch_compile = False
         return c
 
-    @pytest.fixture(scope="function")
-    def ppo(self, train_config):
+    @pytest.fixture(scope="class")
+    def env(self, train_config):
+        # only created for tests using environments, since
+        # disable_view_window imports the renderer
+        c = train_config
+        disable_view_window()
+        return make_vector_env(c.env_name, c.env_num)
+
+    @pytest.fixture(scope="class")
+    def ppo_init(self, train_config):
+        # models are only created (and compiled) once per class,
+        # ``ppo`` resets them to this initial snapshot for each test
         c = train_config
         actor = smw(Actor(c.observe_dim, c.action_num)
                     .to(c.device), c.device, c.device)
         critic = smw(Critic(c.observe_dim)
                      .to(c.device), c.device, c.device)
+        actor = maybe_compile(actor, c.use_torch_compile)
+        critic = maybe_compile(critic, c.use_torch_compile)
         ppo = PPO(actor, critic,
                   t.optim.Adam,
                   nn.MSELoss(reduction='sum'),
                   replay_device="cpu",
                   replay_size=c.replay_size)
+        snapshot = deepcopy((ppo.actor.state_dict(),
+                             ppo.critic.state_dict(),
+                             ppo.actor_optim.state_dict(),
+                             ppo.critic_optim.state_dict(),
+                             ppo.gae_lambda))
+        return ppo, snapshot
+
+    @pytest.fixture(scope="function")
+    def ppo(self, ppo_init):
+        ppo, snapshot = ppo_init
+        snapshot = deepcopy(snapshot)
+        ppo.actor.load_state_dict(snapshot[0])
+        ppo.critic.load_state_dict(snapshot[1])
+        ppo.actor_optim.load_state_dict(snapshot[2])
+        ppo.critic_optim.load_state_dict(snapshot[3])
+        ppo.gae_lambda = snapshot[4]
+        ppo.replay_buffer.clear()
         return ppo
 
     @pytest.fixture(scope="function")
@@ -95,6 +134,8 @@ class TestPPO(object):
                     .to(c.device), c.device, c.device)
         critic = smw(Critic(c.observe_dim)
                      .to(c.device), c.device, c.device)
+        actor = maybe_compile(actor, c.use_torch_compile)
+        critic = maybe_compile(critic, c.use_torch_compile)
         ppo = PPO(actor, critic,
                   t.optim.Adam,
                   nn.MSELoss(reduction='sum'),
@@ -131,25 +172,18 @@ class TestPPO(object):
         c = train_config
         old_state = state = t.zeros([1, c.observe_dim])
         action = t.zeros([1, 1])
-        ppo_vis.store_episode([
-            {"state": {"state": old_state},
-             "action": {"action": action},
-             "next_state": {"state": state},
-             "reward": 0,
-             "terminal": False}
-            for _ in range(3)
-        ])
+        # store_episode writes "value" and "gae" into each transition, they
+        # depend on its position in the episode, so dicts are not shared
+        transition = {"state": {"state": old_state},
+                      "action": {"action": action},
+                      "next_state": {"state": state},
+                      "reward": 0,
+                      "terminal": False}
+        ppo_vis.store_episode([dict(transition) for _ in range(3)])
         ppo_vis.update(update_value=True, update_policy=True,
                        update_target=True, concatenate_samples=True)
         ppo_vis.entropy_weight = 1e-3
-        ppo_vis.store_episode([
-            {"state": {"state": old_state},
-             "action": {"action": action},
-             "next_state": {"state": state},
-             "reward": 0,
-             "terminal": False}
-            for _ in range(3)
-        ])
+        ppo_vis.store_episode([dict(transition) for _ in range(3)])
         ppo_vis.update(update_value=False, update_policy=False,
                        update_target=False, concatenate_samples=True)
 
@@ -167,61 +201,70 @@ class TestPPO(object):
     # Test for PPO full training.
     ########################################################################
     @pytest.mark.parametrize("gae_lambda", [0.0, 0.5, 1.0])
-    def test_full_train(self, train_config, ppo, gae_lambda):
+    def test_full_train(self, train_config, env, ppo, gae_lambda):
         c = train_config
         ppo.gae_lambda = gae_lambda
 
         # begin training
-        episode, step = Counter(), Counter()
-        reward_fulfilled = Counter()
-        smoother = Smooth()
-        terminal = False
-
-        env = c.env
+        # total rewards are smoothed with the same rate as Smooth
+        episode = 0
+        reward_fulfilled = 0
+        smoothed_reward = None
+
+        # step all environments together, each one of them has its own
+        # episode, which is stored and used to update as soon as it
+        # terminates or is truncated, so an update is performed for every
+        # finished sub environment, not once per vector step, steps other
+        # environments have collected with an older policy are still
+        # treated as on-policy when their episodes are stored
+        states = [[] for _ in range(c.env_num)]
+        actions = [[] for _ in range(c.env_num)]
+        rewards = [[] for _ in range(c.env_num)]
+        state = obs_to_tensor(env.reset(), c.device)
         while episode < c.max_episodes:
-            episode.count()
-
-            # batch size = 1
-            total_reward = 0
-            state = t.tensor(env.reset(), dtype=t.float32, device=c.device)
-
-            tmp_observations = []
-            while not terminal and step <= c.max_steps:
-                step.count()
-                with t.no_grad():
-                    old_state = state
-                    # agent model inference
-                    action = ppo.act({"state": old_state.unsqueeze(0)})[0]
-                    state, reward, terminal, _ = env.step(action.item())
-                    state = t.tensor(state, dtype=t.float32, device=c.device) \
-                        .flatten()
-                    total_reward += float(reward)
-
-                    tmp_observations.append({
-                        "state": {"state": old_state.unsqueeze(0)},
-                        "action": {"action": action},
-                        "next_state": {"state": state.unsqueeze(0)},
-                        "reward": float(reward),
-                        "terminal": terminal or step == c.max_steps
-                    })
-
-            # update
-            ppo.store_episode(tmp_observations)
-            ppo.update()
-
-            smoother.update(total_reward)
-            step.reset()
-            terminal = False
-
-            logger.info("Episode {} total reward={:.2f}"
-                        .format(episode, smoother.value))
-
-            if smoother.value > c.solved_reward:
-                reward_fulfilled.count()
-                if reward_fulfilled >= c.solved_repeat:
-                    logger.info("Environment solved!")
-                    return
-            else:
-                reward_fulfilled.reset()
+            old_state = state
+            # agent model inference, observations are created outside,
+            # since they are used by the critic in store_episode
+            with inference_mode():
+                action = ppo.act({"state": old_state})[0]
+            state, reward, terminal, _ = \
+                env.step(action.view(-1).cpu().numpy())
+            state = obs_to_tensor(state, c.device)
+
+            for i in range(c.env_num):
+                states[i].append(old_state[i:i + 1])
+                actions[i].append(action[i:i + 1])
+                rewards[i].append(float(reward[i]))
+                if not terminal[i] and len(rewards[i]) < c.max_steps:
+                    continue
+
+                # update
+                episode += 1
+                ppo.store_episode(make_episode(states[i], actions[i],
+                                               rewards[i], state[i:i + 1]))
+                ppo.update()
+
+                total_reward = sum(rewards[i])
+                smoothed_reward = (total_reward
+                                   if smoothed_reward is None
+                                   else smoothed_reward * 0.8
+                                   + total_reward * 0.2)
+                states[i], actions[i], rewards[i] = [], [], []
+                if not terminal[i]:
+                    # truncated by max_steps, vector environments only
+                    # reset terminated sub environments automatically
+                    state[i] = obs_to_tensor(env.envs[i].reset(), c.device)
+
+                # formatted only if the message is emitted
+                logger.info("Episode %d total reward=%.2f",
+                            episode, smoothed_reward)
+
+                if smoothed_reward > c.solved_reward:
+                    reward_fulfilled += 1
+                    if reward_fulfilled >= c.solved_repeat:
+                        logger.info("Environment solved!")
+                        return
+                else:
+                    reward_fulfilled = 0
 
         pytest.fail("PPO Training failed.")
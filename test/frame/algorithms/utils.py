@@ -1,4 +1,7 @@
 from gym.wrappers.time_limit import TimeLimit
+import gym
+import numpy as np
+import torch as t
 
 
 def unwrap_time_limit(env):
@@ -9,6 +12,50 @@ def unwrap_time_limit(env):
         return env
 
 
+# cheaper than no_grad, tensors created inside must not be saved for
+# backward later, requires pytorch >= 1.9
+inference_mode = getattr(t, "inference_mode", t.no_grad)
+
+
+def make_vector_env(env_name, env_num):
+    # step several environments together, so that the agent could
+    # act on a batch of states
+    return gym.vector.SyncVectorEnv(
+        [lambda: unwrap_time_limit(gym.make(env_name))
+         for _ in range(env_num)]
+    )
+
+
+def obs_to_tensor(observation, device):
+    # vector environments return a new array on every step, wrap it
+    # without copying, data is only copied if moved to another device
+    return t.from_numpy(np.asarray(observation, dtype=np.float32)).to(device)
+
+
+def make_episode(states, actions, rewards, last_state):
+    # build transitions of an episode from per step lists collected during
+    # the rollout, the next state of a step is the state of the next step,
+    # and only the last transition is terminal
+    next_states = states[1:] + [last_state]
+    episode = [{"state": {"state": st},
+                "action": {"action": act},
+                "next_state": {"state": next_st},
+                "reward": rew,
+                "terminal": False}
+               for st, act, next_st, rew
+               in zip(states, actions, next_states, rewards)]
+    episode[-1]["terminal"] = True
+    return episode
+
+
+def maybe_compile(module, use_torch_compile):
+    # compile in place, so that the forward signature inspected by
+    # safe_call and state dict keys are kept, requires pytorch >= 2.2
+    if use_torch_compile and hasattr(module, "compile"):
+        module.compile(dynamic=False, fullgraph=True)
+    return module
+
+
 class Smooth(object):
     def __init__(self):
         self._value = None
@@ -54,10 +54,12 @@ class TestBuffer(object):
          ValueError, "Transition object has different attributes"),
     ]
 
+    @pytest.mark.parametrize("columnar", [False, True])
     @pytest.mark.parametrize("trans_list,require_attr,"
                              "exception,match", param_test_append)
-    def test_append(self, trans_list, require_attr, exception, match):
-        buffer = Buffer(self.BUFFER_SIZE)
+    def test_append(self, trans_list, require_attr, exception, match,
+                    columnar):
+        buffer = Buffer(self.BUFFER_SIZE, columnar=columnar)
         if exception is not None:
             with pytest.raises(exception, match=match):
                 for trans in trans_list:
@@ -66,6 +68,148 @@ class TestBuffer(object):
             for trans in trans_list:
                 buffer.append(trans, require_attr)
 
+    def test_append_columnar(self):
+        buffer = Buffer(2, columnar=True)
+        buffer.append({"state": {"state_1": t.zeros([1, 2])},
+                       "action": {"action_1": t.zeros([1, 3])},
+                       "next_state": {"next_state_1": t.zeros([1, 2])},
+                       "reward": 1,
+                       "terminal": True})
+        # integer reward column is promoted to float
+        buffer.append({"state": {"state_1": t.ones([1, 2])},
+                       "action": {"action_1": t.ones([1, 3])},
+                       "next_state": {"next_state_1": t.ones([1, 2])},
+                       "reward": 0.5,
+                       "terminal": False})
+        assert buffer.buffer[0].reward == 1
+        assert buffer.buffer[1].reward == 0.5
+        assert buffer.buffer[1].terminal is False
+        assert t.all(buffer.buffer[1].state["state_1"] == 1)
+        with pytest.raises(ValueError, match="stored shape"):
+            buffer.append({"state": {"state_1": t.zeros([1, 3])},
+                           "action": {"action_1": t.zeros([1, 3])},
+                           "next_state": {"next_state_1": t.zeros([1, 2])},
+                           "reward": 1,
+                           "terminal": True})
+
+    def test_append_columnar_dtype(self):
+        buffer = Buffer(2, columnar=True)
+        buffer.append({"state": {"state_1": t.zeros([1, 2])},
+                       "action": {"action_1": t.zeros([1, 1],
+                                                      dtype=t.long)},
+                       "next_state": {"next_state_1": t.zeros([1, 2])},
+                       "reward": t.zeros([1, 1]),
+                       "terminal": True})
+        # float values must not be truncated by a long column
+        with pytest.raises(ValueError, match="stored dtype"):
+            buffer.append({"state": {"state_1": t.zeros([1, 2])},
+                           "action": {"action_1": t.full([1, 1], 0.7)},
+                           "next_state": {"next_state_1": t.zeros([1, 2])},
+                           "reward": t.zeros([1, 1]),
+                           "terminal": True})
+        with pytest.raises(ValueError, match="stored dtype"):
+            buffer.append({"state": {"state_1": t.zeros([1, 2])},
+                           "action": {"action_1": t.zeros([1, 1],
+                                                          dtype=t.long)},
+                           "next_state": {"next_state_1": t.zeros([1, 2])},
+                           "reward": t.zeros([1, 1], dtype=t.float64),
+                           "terminal": True})
+        assert buffer.size() == 1
+
+    def test_append_columnar_rejected(self):
+        buffer = Buffer(2, columnar=True)
+        for i in range(2):
+            buffer.append({"state": {"a": t.full([1, 2], i),
+                                     "b": t.full([1, 2], i)},
+                           "action": {"action_1": t.zeros([1, 3])},
+                           "next_state": {"a": t.zeros([1, 2]),
+                                          "b": t.zeros([1, 2])},
+                           "reward": i,
+                           "terminal": False})
+        # buffer is full, the next append would overwrite row 0
+        with pytest.raises(ValueError, match="stored shape"):
+            buffer.append({"state": {"a": t.full([1, 2], 9),
+                                     "b": t.full([1, 3], 9)},
+                           "action": {"action_1": t.zeros([1, 3])},
+                           "next_state": {"a": t.zeros([1, 2]),
+                                          "b": t.zeros([1, 2])},
+                           "reward": 9,
+                           "terminal": True})
+        assert buffer.size() == 2
+        assert buffer.buffer.index == 0
+        for i in range(2):
+            assert self.t_eq(buffer.buffer[i]["state"]["a"],
+                             t.full([1, 2], i))
+            assert self.t_eq(buffer.buffer[i]["state"]["b"],
+                             t.full([1, 2], i))
+            assert buffer.buffer[i]["reward"] == i
+            assert buffer.buffer[i]["terminal"] is False
+
+    def test_init_pin_memory_device(self):
+        with pytest.raises(ValueError, match="could be pinned"):
+            Buffer(self.BUFFER_SIZE, "cuda:0",
+                   columnar=True, pin_memory=True)
+
+    def test_init_pin_memory_list(self):
+        with pytest.raises(ValueError, match="Only columnar buffers"):
+            Buffer(self.BUFFER_SIZE, pin_memory=True)
+
+    @pytest.mark.skipif(not t.cuda.is_available(), reason="requires cuda")
+    def test_append_pin_memory(self, pytestconfig):
+        buffer = Buffer(self.BUFFER_SIZE, columnar=True, pin_memory=True)
+        buffer.append({"state": {"state_1": t.zeros([1, 2])},
+                       "action": {"action_1": t.zeros([1, 3])},
+                       "next_state": {"next_state_1": t.zeros([1, 2])},
+                       "reward": 1,
+                       "terminal": True})
+        assert buffer.buffer.columns["state"]["state_1"].is_pinned()
+        device = pytestconfig.getoption("gpu_device")
+        _, (state,) = buffer.sample_batch(1, device=device,
+                                          sample_method="random",
+                                          sample_attrs=["state"])
+        assert self.t_eq(state["state_1"], t.zeros([1, 2]))
+
+    @pytest.mark.parametrize("columnar", [False, True])
+    def test_append_ring(self, columnar):
+        buffer = Buffer(3, columnar=columnar)
+        positions = []
+        for i in range(5):
+            positions.append(buffer.append(
+                {"state": {"state_1": t.full([1, 2], i)},
+                 "action": {"action_1": t.zeros([1, 3])},
+                 "next_state": {"next_state_1": t.full([1, 2], i + 1)},
+                 "reward": i,
+                 "terminal": False}
+            ))
+        assert positions == [0, 1, 2, 0, 1]
+        assert buffer.size() == 3
+        assert [buffer.buffer[i].reward for i in range(3)] == [3, 4, 2]
+        buffer.clear()
+        assert buffer.append(
+            {"state": {"state_1": t.zeros([1, 2])},
+             "action": {"action_1": t.zeros([1, 3])},
+             "next_state": {"next_state_1": t.zeros([1, 2])},
+             "reward": 0,
+             "terminal": False}
+        ) == 0
+
+    @pytest.mark.parametrize("columnar", [False, True])
+    def test_append_detach(self, columnar):
+        buffer = Buffer(self.BUFFER_SIZE, columnar=columnar)
+        param = t.zeros([1, 2], requires_grad=True)
+        trans = Transition(
+            state={"state_1": t.zeros([1, 2])},
+            action={"action_1": t.zeros([1, 3])},
+            next_state={"next_state_1": t.zeros([1, 2])},
+            reward=1,
+            terminal=True)
+        trans["state"] = {"state_1": param * 2}
+        buffer.append(trans)
+        stored = buffer.buffer[0]
+        for ma in ("state", "action", "next_state"):
+            for v in stored[ma].values():
+                assert not v.requires_grad
+
     ########################################################################
     # Test for Buffer.clear
     ########################################################################
@@ -78,9 +222,10 @@ class TestBuffer(object):
           "some_custom_attr": None}]
     ]
 
+    @pytest.mark.parametrize("columnar", [False, True])
     @pytest.mark.parametrize("trans_list", param_test_clear)
-    def test_clear(self, trans_list):
-        buffer = Buffer(self.BUFFER_SIZE)
+    def test_clear(self, trans_list, columnar):
+        buffer = Buffer(self.BUFFER_SIZE, columnar=columnar)
         for trans in trans_list:
             buffer.append(trans)
         buffer.clear()
@@ -95,8 +240,9 @@ class TestBuffer(object):
         b = b.to(a.device)
         return t.all(a == b)
 
-    @pytest.fixture(scope="class")
-    def const_buffer(self, pytestconfig):
+    @pytest.fixture(scope="class", params=[False, True],
+                    ids=["list", "columnar"])
+    def const_buffer(self, pytestconfig, request):
         data = [{"state": {"state_1": t.zeros([1, 2])},
                  "action": {"action_1": t.zeros([1, 3])},
                  "next_state": {"next_state_1": t.zeros([1, 4])},
@@ -106,7 +252,8 @@ class TestBuffer(object):
                  "not_concatenable": (i, "some_str")}
                 for i in range(self.SAMPLE_BUFFER_SIZE)]
         buffer = Buffer(buffer_size=self.SAMPLE_BUFFER_SIZE,
-                        buffer_device=pytestconfig.getoption("gpu_device"))
+                        buffer_device=pytestconfig.getoption("gpu_device"),
+                        columnar=request.param)
         for d in data:
             buffer.append(d)
         return buffer
@@ -118,7 +265,8 @@ class TestBuffer(object):
     @pytest.mark.parametrize("concat", [True, False])
     @pytest.mark.parametrize("dev", [None, "cpu"])  # buffer already on gpu
     @pytest.mark.parametrize("sample_method", [
-        "random", "random_unique", "all", "some_invalid_method"
+        "random", "random_unique", "all", "some_invalid_method",
+        Buffer.sample_method_random_unique
     ])
     @pytest.mark.parametrize("sample_attrs,concat_attrs,should_be_attrs", [
         # Case 0
@@ -243,6 +391,24 @@ class TestBuffer(object):
                                 len(data) == bsize and
                                 isinstance(data[0], tuple))
 
+    def test_sample_all_columnar(self):
+        buffer = Buffer(self.SAMPLE_BUFFER_SIZE, columnar=True)
+        for i in range(3):
+            buffer.append({"state": {"state_1": t.full([1, 2], i)},
+                           "action": {"action_1": t.zeros([1, 3])},
+                           "next_state": {"next_state_1": t.zeros([1, 2])},
+                           "reward": i,
+                           "terminal": False})
+        bsize, (state, reward) = buffer.sample_batch(
+            0, sample_method="all", sample_attrs=["state", "reward"]
+        )
+        assert bsize == 3
+        # sampled columns are views of the storage, no copy is made
+        column = buffer.buffer.columns["state"]["state_1"]
+        assert state["state_1"].data_ptr() == column.data_ptr()
+        assert self.t_eq(state["state_1"][:, 0], t.arange(3).float())
+        assert self.t_eq(reward.view(-1), t.arange(3).float())
+
     ########################################################################
     # Test for Buffer.__reduce__
     ########################################################################
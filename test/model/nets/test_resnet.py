@@ -0,0 +1,58 @@
+from machin.model.nets.resnet import ResNet
+
+import pytest
+import torch as t
+import torch.nn as nn
+
+
+class TestResNet(object):
+    ########################################################################
+    # Test for ResNet.fuse_for_inference
+    ########################################################################
+    @staticmethod
+    def randomize_bn(net):
+        # freshly initialized batch norm layers are identities in eval mode
+        with t.no_grad():
+            for module in net.modules():
+                if isinstance(module, nn.BatchNorm2d):
+                    module.running_mean.uniform_(-0.5, 0.5)
+                    module.running_var.uniform_(0.5, 1.5)
+                    module.weight.uniform_(0.5, 1.5)
+                    module.bias.uniform_(-0.5, 0.5)
+
+    @staticmethod
+    def features(net, x):
+        # the fc layer only fits the output of basic blocks, compare outputs
+        # of the convolution trunk for bottleneck blocks
+        if net.depth >= 50:
+            if net.channels_last:
+                x = x.contiguous(memory_format=t.channels_last)
+            return net.base(x)
+        return net(x)
+
+    @pytest.mark.parametrize("channels_last", [False, True])
+    @pytest.mark.parametrize("depth", [18, 50])
+    def test_fuse_for_inference(self, depth, channels_last):
+        t.manual_seed(0)
+        net = ResNet(3, depth, 10, norm="batch",
+                     channels_last=channels_last)
+        self.randomize_bn(net)
+        net.eval()
+        x = t.rand([2, 3, 224, 224])
+        with t.no_grad():
+            expected = self.features(net, x)
+            net.fuse_for_inference()
+            result = self.features(net, x)
+        assert not any(isinstance(module, nn.BatchNorm2d)
+                       for module in net.modules())
+        if channels_last:
+            assert net.conv1.weight.is_contiguous(
+                memory_format=t.channels_last
+            )
+        assert t.allclose(result, expected, rtol=1e-3,
+                          atol=1e-4 * expected.abs().max().item())
+
+    def test_fuse_for_inference_training(self):
+        net = ResNet(3, 18, 10, norm="batch")
+        with pytest.raises(RuntimeError, match="evaluation mode"):
+            net.fuse_for_inference()
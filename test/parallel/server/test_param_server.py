@@ -1,8 +1,15 @@
 from machin.parallel.server import (
+    PushPullGradServer,
     PushPullGradServerImpl,
     PushPullModelServerImpl
 )
+from machin.parallel.server.param_server import (
+    _bucket_tensors,
+    _flatten_buckets,
+    _unflatten_buckets
+)
 from test.util_run_multi import *
+from queue import Queue
 import random
 import torch as t
 import torch.nn as nn
@@ -95,13 +102,14 @@ class TestPushPullModelServer(WorldTestBase):
 
 class TestPushPullGradServer(WorldTestBase):
     @staticmethod
+    @pytest.mark.parametrize("use_async", [False, True])
     @pytest.mark.parametrize("reduce_method,new_weight",
                              [("mean", (-5, -1, 1)),
                               ("sum", (-23, -10, -5))])
     @run_multi(expected_results=[True, True, True],
-               pass_through=["reduce_method", "new_weight"])
+               pass_through=["reduce_method", "new_weight", "use_async"])
     @WorldTestBase.setup_world
-    def test_push_pull(rank, reduce_method, new_weight):
+    def test_push_pull(rank, reduce_method, new_weight, use_async):
         world = get_world()
         if rank == 0:
             # only one reduce slave, so result is controllable
@@ -132,7 +140,11 @@ class TestPushPullGradServer(WorldTestBase):
                 model.zero_grad()
                 loss = model(t.ones([1, 1]))
                 loss.backward()
-                server.push(model)
+                if use_async:
+                    # must reach the same result as the synchronous push
+                    server.push_async(model).wait()
+                else:
+                    server.push(model)
                 _log(rank, "iter {}, model: {}".format(i, model))
                 sleep(random.random() * 0.2)
             sleep(3)
@@ -151,3 +163,86 @@ class TestPushPullGradServer(WorldTestBase):
             assert model.fc3.weight.item() == new_weight[2]
             group.barrier()
         return True
+
+
+class TestBuckets(object):
+    # 1024 float32 elements = 4 KiB
+    KB4 = 4 / 1024
+
+    def test_bucket_cap(self):
+        tensors = [t.zeros([1024]) for _ in range(4)]
+        assert _bucket_tensors(tensors, 2 * self.KB4) == [[3, 2], [1, 0]]
+        assert _bucket_tensors(tensors, 4 * self.KB4) == [[3, 2, 1, 0]]
+
+    def test_bucket_dtype(self):
+        tensors = [t.zeros([2]), t.zeros([2]),
+                   t.zeros([2], dtype=t.float64), t.zeros([2])]
+        assert _bucket_tensors(tensors, 25) == [[3], [2], [1, 0]]
+
+    def test_bucket_single(self):
+        assert _bucket_tensors([t.zeros([1024])], self.KB4 / 2) == [[0]]
+        # tensors larger than the cap get a bucket of their own
+        tensors = [t.zeros([1]), t.zeros([2048]), t.zeros([1])]
+        assert _bucket_tensors(tensors, self.KB4) == [[2], [1], [0]]
+
+    @pytest.mark.parametrize("bucket_cap_mb", [25, 1e-5])
+    def test_flatten_unflatten(self, bucket_cap_mb):
+        tensors = [t.rand([2, 3]), t.rand([4]),
+                   t.randint(10, [3], dtype=t.long), t.rand([1])]
+        flat = _flatten_buckets(tensors, bucket_cap_mb)
+        assert len(flat) == len(_bucket_tensors(tensors, bucket_cap_mb))
+        for f in flat:
+            assert f.device == t.device("cpu")
+            f.fill_(0)
+        # results never share storage with inputs
+        assert all(t.any(tensor != 0) for tensor in tensors)
+
+        flat = _flatten_buckets(tensors, bucket_cap_mb)
+        unflat = _unflatten_buckets(flat, tensors, bucket_cap_mb)
+        for tensor, result in zip(tensors, unflat):
+            assert result.dtype == tensor.dtype
+            assert t.equal(result, tensor)
+
+    def test_unflatten_mismatch(self):
+        tensors = [t.rand([2, 3]), t.rand([4])]
+        flat = _flatten_buckets(tensors, 25)
+        with pytest.raises(ValueError, match="Expect 1 buckets"):
+            _unflatten_buckets(flat + flat, tensors, 25)
+        with pytest.raises(ValueError, match="Bucket 0 has 10 elements"):
+            _unflatten_buckets(flat, [t.rand([2, 3]), t.rand([5])], 25)
+
+
+class TestGradCompression(object):
+    def test_compress(self):
+        server = PushPullGradServer("server", None, "model", [], None,
+                                    compress_dtype=t.bfloat16)
+        grad = t.full([2], 1.001)
+        total = t.zeros([2])
+        for _ in range(4):
+            compressed = server._compress(0, grad)
+            assert compressed.dtype == t.bfloat16
+            total += compressed.float()
+        # bf16(1.001) == 1, residuals are accumulated and fed back
+        assert t.all(total != 4)
+        assert t.allclose(total + server._grad_residuals[0],
+                          t.full([2], 4.004))
+        # non floating point tensors are not compressed
+        int_grad = t.ones([2], dtype=t.long)
+        assert server._compress(1, int_grad) is int_grad
+        assert 1 not in server._grad_residuals
+
+    @pytest.mark.parametrize("reduce_method,expected,rounded",
+                             [("sum", 4.004, 4), ("mean", 1.001, 1)])
+    def test_reduce_compressed(self, reduce_method, expected, rounded):
+        server = PushPullGradServer("server", None, "model", [], None,
+                                    compress_dtype=t.bfloat16)
+        queue = Queue()
+        for _ in range(4):
+            queue.put({0: server._compress(0, t.full([2], 1.001))})
+        grad_dict = PushPullGradServerImpl._reduce_batch(
+            queue, 4, reduce_method, "cpu"
+        )
+        # reduced in float32 and not rounded back to bf16
+        assert grad_dict[0].dtype == t.float32
+        assert t.all(grad_dict[0] != rounded)
+        assert t.allclose(grad_dict[0], t.full([2], expected), atol=1e-2)